@@ -1,358 +1,716 @@
-import streamlit as st
-import sqlite3
-import os
-import datetime
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate # CORRECTED IMPORT
-from langchain_core.output_parsers import StrOutputParser # NEW IMPORT for LCEL
-import base64
-from contextlib import contextmanager
-
-# --- 1. Setup and Configuration ---
-
-# Load environment variables
-load_dotenv()
-API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Set Streamlit page config
-st.set_page_config(
-    page_title="AI Content Workflow Tool",
-    page_icon="🤖",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# --- 2. Database Management (SQLite) ---
-
-DB_NAME = "content_workflow.db"
-
-@contextmanager
-def get_db_connection():
-    """Context manager for SQLite database connection."""
-    conn = sqlite3.connect(DB_NAME)
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def init_db():
-    """Initialize the SQLite database and create the content table."""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS content (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            content_type TEXT,
-            tone TEXT,
-            length TEXT,
-            topic TEXT,
-            idea TEXT,
-            outline TEXT,
-            draft TEXT,
-            final_content TEXT,
-            clarity_score INTEGER,
-            engagement_score INTEGER
-        )
-        """)
-        conn.commit()
-
-def save_content(content_type, tone, length, topic, idea, outline, draft, final_content, clarity, engagement):
-    """Save a full content workflow run to the database."""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT INTO content (content_type, tone, length, topic, idea, outline, draft, final_content, clarity_score, engagement_score)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (content_type, tone, length, topic, idea, outline, draft, final_content, clarity, engagement))
-        conn.commit()
-    st.toast("Content saved to database!", icon="✅")
-
-# --- 3. Prompt Engineering & Few-Shot Examples ---
-
-# This dict simulates few-shot prompting by providing specific style examples.
-FEW_SHOT_EXAMPLES = {
-    "Professional": """
-    **Example:** "We are pleased to announce our quarterly earnings, which demonstrate significant growth in key sectors. Our strategic initiatives have yielded positive results, and we anticipate continued success."
-    """,
-    "Witty": """
-    **Example:** "You know what's great? Saving money. You know what's not great? Missing this sale. Don't be the person who misses the sale. Your wallet will thank you (and so will we)."
-    """,
-    "Casual": """
-    **Example:** "Hey everyone, just wanted to share a quick update. We've been working on this new feature and it's finally ready. Check it out and let us know what you think!"
-    """,
-    "Informative": """
-    **Example:** "The new Series 8 processor utilizes a 4nm architecture, which allows for a 20% increase in computational efficiency while reducing power consumption by 15% compared to the previous generation."
-    """
-}
-
-# --- 4. LangChain Configuration (NOW USING LCEL) ---
-
-# Check for API Key
-if not API_KEY:
-    st.error("OPENAI_API_KEY not found. Please add it to your .env file.")
-    st.stop()
-
-# Initialize the LLM (Using gpt-4o-mini for a balance of cost and capability)
-llm = ChatOpenAI(
-    temperature=0.7,
-    model_name="gpt-4o-mini",
-    openai_api_key=API_KEY
-)
-
-# Initialize the simple output parser
-parser = StrOutputParser()
-
-# Chain 1: Idea Generation (LCEL Pipeline: Prompt | LLM | Parser)
-idea_template = PromptTemplate(
-    input_variables=["topic", "content_type"],
-    template="Generate 3 distinct content ideas for a {content_type} about {topic}. Present them as a bulleted list."
-)
-idea_chain = idea_template | llm | parser # LCEL setup
-
-# Chain 2: Outline (LCEL Pipeline: Prompt | LLM | Parser)
-outline_template = PromptTemplate(
-    input_variables=["idea"],
-    template="Create a detailed, multi-point outline for the following content idea. The outline should be structured to flow logically from introduction to conclusion.\n\nIdea:\n{idea}"
-)
-outline_chain = outline_template | llm | parser # LCEL setup
-
-# Chain 3: Draft (LCEL Pipeline: Prompt | LLM | Parser)
-draft_template = PromptTemplate(
-    input_variables=["outline", "tone", "length", "few_shot_example"],
-    template="Write a draft that is approximately {length} words long, based on the following outline. \n\nAdopt a {tone} tone. For reference, here is an example of that tone:\n{few_shot_example}\n\nOutline:\n{outline}"
-)
-draft_chain = draft_template | llm | parser # LCEL setup
-
-# Chain 4: SEO & Tone Refinement (LCEL Pipeline: Prompt | LLM | Parser)
-refine_template = PromptTemplate(
-    input_variables=["draft", "tone"],
-    template="""Refine the following draft.
-    1.  Improve clarity and flow.
-    2.  Ensure the {tone} tone is consistent throughout.
-    3.  Suggest 3-5 relevant SEO keywords.
-
-    Return your response in two parts, separated by '---NOTES---'.
-    Part 1: The full, refined content.
-    Part 2: Your SEO and refinement notes.
-
-    Draft:\n{draft}
-    """
-)
-refine_chain = refine_template | llm | parser # LCEL setup
-
-# --- 5. Helper Functions ---
-
-def get_download_link(content, filename, text):
-    """Generates a link to download content as a file."""
-    b64 = base64.b64encode(content.encode()).decode()
-    return f'<a href="data:file/txt;base64,{b64}" download="{filename}" style="text-decoration: none; padding: 6px 12px; background-color: #0068c9; color: white; border-radius: 8px;">{text}</a>'
-
-# --- 6. Streamlit UI ---
-
-st.title("🤖 AI Content Workflow Tool")
-st.caption("Generate and refine content using AI-powered prompt chaining.")
-
-# Initialize database
-init_db()
-
-# Initialize session state variables
-if "idea" not in st.session_state:
-    st.session_state.idea = ""
-if "outline" not in st.session_state:
-    st.session_state.outline = ""
-if "draft" not in st.session_state:
-    st.session_state.draft = ""
-if "final_content" not in st.session_state:
-    st.session_state.final_content = ""
-if "notes" not in st.session_state:
-    st.session_state.notes = ""
-
-# --- Sidebar Controls ---
-with st.sidebar:
-    st.header("⚙️ Workflow Controls")
-    st.markdown("Configure the content generation parameters.")
-
-    content_type = st.selectbox(
-        "Content Type",
-        ["Blog Post", "Ad Copy", "Social Media Caption"],
-        key="content_type"
-    )
-    
-    tone = st.selectbox(
-        "Tone / Personality",
-        ["Professional", "Witty", "Casual", "Informative"],
-        key="tone"
-    )
-    
-    length = st.select_slider(
-        "Approximate Length",
-        options=["Short (50 words)", "Medium (150 words)", "Long (300 words)"],
-        key="length"
-    )
-    
-    st.divider()
-    user_topic = st.text_input("Enter your main topic or keyword:", key="user_topic")
-
-# --- Main Workflow Area ---
-st.subheader("1. Idea Generation")
-st.session_state.idea = st.text_area(
-    "Generated Ideas",
-    value=st.session_state.idea,
-    height=150,
-    key="idea_text",
-    help="Ideas will appear here. You can edit them before the next step."
-)
-if st.button("1. Generate Ideas", use_container_width=True, type="primary"):
-    if user_topic:
-        with st.spinner("Generating ideas..."):
-            # LCEL execution using .invoke()
-            response = idea_chain.invoke({"topic": user_topic, "content_type": content_type})
-            st.session_state.idea = response
-            st.rerun() # Rerun to update the text area
-    else:
-        st.warning("Please enter a topic in the sidebar.")
-
-st.subheader("2. Outline")
-st.session_state.outline = st.text_area(
-    "Generated Outline",
-    value=st.session_state.outline,
-    height=200,
-    key="outline_text",
-    help="The outline will appear here. You can edit it before drafting."
-)
-if st.button("2. Generate Outline", use_container_width=True, type="primary"):
-    if st.session_state.idea:
-        with st.spinner("Generating outline..."):
-            # We use the (potentially edited) text from the box
-            # LCEL execution using .invoke()
-            response = outline_chain.invoke({"idea": st.session_state.idea_text})
-            st.session_state.outline = response
-            st.rerun()
-    else:
-        st.warning("Please generate an idea first.")
-
-st.subheader("3. Draft Content")
-st.session_state.draft = st.text_area(
-    "Generated Draft",
-    value=st.session_state.draft,
-    height=300,
-    key="draft_text",
-    help="The first draft will appear here. You can edit it before refinement."
-)
-if st.button("3. Generate Draft", use_container_width=True, type="primary"):
-    if st.session_state.outline:
-        with st.spinner("Generating draft..."):
-            few_shot_example = FEW_SHOT_EXAMPLES.get(st.session_state.tone, "No example available.")
-            
-            # LCEL execution using .invoke()
-            response = draft_chain.invoke({
-                "outline": st.session_state.outline_text,
-                "tone": st.session_state.tone,
-                "length": st.session_state.length.split(" ")[0], # e.g., "Short"
-                "few_shot_example": few_shot_example
-            })
-            st.session_state.draft = response
-            st.rerun()
-    else:
-        st.warning("Please generate an outline first.")
-
-st.subheader("4. SEO & Tone Refinement")
-st.session_state.final_content = st.text_area(
-    "Refined Content",
-    value=st.session_state.final_content,
-    height=300,
-    key="final_content_text",
-    help="The final, polished content will appear here."
-)
-if st.button("4. Refine Content", use_container_width=True, type="primary"):
-    if st.session_state.draft:
-        with st.spinner("Refining content..."):
-            # LCEL execution using .invoke()
-            response = refine_chain.invoke({
-                "draft": st.session_state.draft_text,
-                "tone": st.session_state.tone
-            })
-            # Split the output based on the separator
-            parts = response.split("---NOTES---")
-            st.session_state.final_content = parts[0].strip()
-            if len(parts) > 1:
-                st.session_state.notes = parts[1].strip()
-            else:
-                st.session_state.notes = "No notes provided."
-            st.rerun()
-    else:
-        st.warning("Please generate a draft first.")
-
-# Display Refinement Notes
-if st.session_state.notes:
-    with st.expander("View SEO & Refinement Notes"):
-        st.markdown(st.session_state.notes)
-
-st.divider()
-
-# --- 5. Evaluation, Saving, and Exporting ---
-st.subheader("5. Evaluate, Save & Export")
-
-if st.session_state.final_content:
-    col1, col2, col3 = st.columns([1, 1, 2])
-    
-    with col1:
-        clarity_score = st.slider("Clarity Score", 1, 5, 3)
-    with col2:
-        engagement_score = st.slider("Engagement Score", 1, 5, 3)
-    
-    with col3:
-        st.markdown("---") # For vertical alignment
-        if st.button("Save to History", use_container_width=True):
-            save_content(
-                st.session_state.content_type,
-                st.session_state.tone,
-                st.session_state.length,
-                st.session_state.user_topic,
-                st.session_state.idea_text,
-                st.session_state.outline_text,
-                st.session_state.draft_text,
-                st.session_state.final_content_text,
-                clarity_score,
-                engagement_score
-            )
-    
-    st.markdown("---")
-    
-    # Prepare export content
-    export_md_content = f"""
-# Topic: {st.session_state.user_topic}
-(Type: {st.session_state.content_type}, Tone: {st.session_state.tone}, Length: {st.session_state.length})
-
-## 1. Ideas
-{st.session_state.idea_text}
-
-## 2. Outline
-{st.session_state.outline_text}
-
-## 3. Draft
-{st.session_state.draft_text}
-
-## 4. Final Refined Content
-{st.session_state.final_content_text}
-
-## 5. Refinement Notes
-{st.session_state.notes}
-"""
-    
-    # Export Buttons
-    export_col1, export_col2 = st.columns(2)
-    with export_col1:
-        st.markdown(
-            get_download_link(export_md_content, "ai_content.md", "Export as Markdown (.md)"), 
-            unsafe_allow_html=True
-        )
-    with export_col2:
-        st.markdown(
-            get_download_link(export_md_content, "ai_content.txt", "Export as Text (.txt)"), 
-            unsafe_allow_html=True
-        )
-else:
-    st.info("Generate content to enable saving and exporting.")
+import streamlit as st
+import sqlite3
+import os
+import datetime
+import sys
+import atexit
+import textwrap
+import functools
+import threading
+from typing import Final
+
+# NOTE: the LangChain / openai / httpx / dotenv imports live inside the
+# cached builders below, not at module level. They pull in a large module
+# graph (pydantic, tiktoken, ...) and Streamlit re-executes this script on
+# every interaction — deferring them into @st.cache_resource functions means
+# only the first run of the process pays the import cost; module level touches
+# only the stdlib and streamlit.
+
+# --- 1. Setup and Configuration ---
+
+@st.cache_resource
+def load_api_key():
+    """Load .env once per process and return the OpenAI API key."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return os.getenv("OPENAI_API_KEY")
+
+API_KEY = load_api_key()
+
+# Set Streamlit page config
+st.set_page_config(
+    page_title="AI Content Workflow Tool",
+    page_icon="🤖",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# --- 2. Database Management (SQLite) ---
+
+DB_NAME = "content_workflow.db"
+
+@st.cache_resource
+def get_db():
+    """Open the shared SQLite connection and its lock once per process.
+
+    Streamlit re-executes this script on every full rerun, so the connection
+    must live behind st.cache_resource — a plain module-level connect() would
+    leak one open connection per rerun. All sessions share this one WAL-mode
+    connection (check_same_thread=False plus the lock make that safe), and
+    WAL stops writers from blocking each other.
+    """
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    atexit.register(conn.close)
+    return conn, threading.Lock()
+
+def init_db():
+    """Initialize the SQLite database and create the content table."""
+    conn, lock = get_db()
+    with lock:
+        # timestamp is stored as an integer unix epoch: 8 bytes instead of a
+        # ~24-char ISO string, and range queries compare integers directly.
+        # strftime('%s','now') rather than unixepoch(), which needs
+        # SQLite >= 3.38 and is missing on e.g. Ubuntu 22.04's 3.37.
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS content (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER DEFAULT (strftime('%s','now')),
+            content_type TEXT,
+            tone TEXT,
+            length TEXT,
+            topic TEXT,
+            idea TEXT,
+            outline TEXT,
+            draft TEXT,
+            final_content TEXT,
+            clarity_score INTEGER,
+            engagement_score INTEGER
+        )
+        """)
+        # Indexes for future history views: search by topic (and type) and
+        # newest-first listings stay O(log N) as the table grows.
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_content_topic ON content(topic, content_type)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_content_timestamp ON content(timestamp DESC)")
+        conn.commit()
+
+def save_contents(rows):
+    """Save multiple workflow runs in one transaction.
+
+    Each row is a (content_type, tone, length, topic, idea, outline, draft,
+    final_content, clarity_score, engagement_score) tuple. executemany inside
+    a single transaction pays one fsync for N rows instead of N.
+    """
+    conn, lock = get_db()
+    with lock:
+        conn.executemany("""
+        INSERT INTO content (content_type, tone, length, topic, idea, outline, draft, final_content, clarity_score, engagement_score)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+
+def save_content(content_type, tone, length, topic, idea, outline, draft, final_content, clarity, engagement):
+    """Save a full content workflow run to the database."""
+    save_contents([(content_type, tone, length, topic, idea, outline, draft, final_content, clarity, engagement)])
+    st.toast("Content saved to database!", icon="✅")
+
+# --- 3. Prompt Engineering & Few-Shot Examples ---
+
+# This dict simulates few-shot prompting by providing specific style examples.
+# The values are dedented, stripped, and interned below so each example is
+# stored once as a canonical string for the lifetime of the process.
+_RAW_FEW_SHOT_EXAMPLES = {
+    "Professional": """
+    **Example:** "We are pleased to announce our quarterly earnings, which demonstrate significant growth in key sectors. Our strategic initiatives have yielded positive results, and we anticipate continued success."
+    """,
+    "Witty": """
+    **Example:** "You know what's great? Saving money. You know what's not great? Missing this sale. Don't be the person who misses the sale. Your wallet will thank you (and so will we)."
+    """,
+    "Casual": """
+    **Example:** "Hey everyone, just wanted to share a quick update. We've been working on this new feature and it's finally ready. Check it out and let us know what you think!"
+    """,
+    "Informative": """
+    **Example:** "The new Series 8 processor utilizes a 4nm architecture, which allows for a 20% increase in computational efficiency while reducing power consumption by 15% compared to the previous generation."
+    """
+}
+
+FEW_SHOT_EXAMPLES: Final = {
+    tone_name: sys.intern(textwrap.dedent(example).strip())
+    for tone_name, example in _RAW_FEW_SHOT_EXAMPLES.items()
+}
+
+# --- 4. LangChain Configuration (NOW USING LCEL) ---
+
+# Check for API Key
+if not API_KEY:
+    st.error("OPENAI_API_KEY not found. Please add it to your .env file.")
+    st.stop()
+
+# Cap on how many tokens each few-shot example may contribute to a prompt.
+# A single fixed budget (rather than one per requested length) keeps the
+# prompt prefix byte-identical across calls, which prefix-caching backends
+# depend on, while still bounding what every call pays in input tokens.
+EXAMPLE_TOKEN_BUDGET: Final = 60
+
+@functools.lru_cache(maxsize=None)
+def _truncate_to_tokens(text, max_tokens):
+    """Trim text to at most max_tokens tokens of the model's tokenizer.
+
+    Falls back to the untruncated text when no tokenizer is available — on a
+    cold machine tiktoken fetches the BPE file over the network, and an
+    offline deployment (e.g. a self-hosted vLLM endpoint) must not crash on
+    that fetch failing.
+    """
+    import tiktoken # Transitive dep of langchain-openai
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return text
+    ids = encoding.encode(text)
+    return encoding.decode(ids[:max_tokens]) if len(ids) > max_tokens else text
+
+@st.cache_resource
+def build_chains():
+    """Build the LLM client and all LCEL chains once per process.
+
+    st.cache_resource keeps the ChatOpenAI client (and its httpx connection
+    pool) alive across script reruns, so repeated LLM calls reuse warm
+    keep-alive connections to api.openai.com instead of paying a fresh TLS
+    handshake each time.
+    """
+    import httpx # Ships with the openai client; used to tune the connection pool
+    from langchain_openai import ChatOpenAI
+    from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnablePassthrough
+
+    # Static bank of ALL tone examples, each trimmed to the token budget.
+    # Keeping this (and the instructions around it) as a fixed prefix means
+    # every draft/refine call shares the same opening tokens regardless of
+    # which tone/length/outline follows. At ~300 tokens this stays well
+    # under the >1024-token minimum of OpenAI's automatic prompt cache, so
+    # on the hosted API the stable prefix does not engage that cache; it
+    # does let prefix-caching backends with no minimum (e.g. vLLM with
+    # --enable-prefix-caching) reuse the shared block. Built here rather
+    # than at module scope so the tokenizer is only touched once per
+    # process, after Streamlit is up.
+    few_shot_bank = "\n".join(
+        f"<{tone_name}>{_truncate_to_tokens(example, EXAMPLE_TOKEN_BUDGET)}</{tone_name}>"
+        for tone_name, example in FEW_SHOT_EXAMPLES.items()
+    )
+
+    # System message for the draft chains: all instructions and all four tone
+    # examples in one static block, identical for every call. Only the short
+    # human message below it varies, so any tone/length/outline combination
+    # shares the same stable prefix (see the note above on which backends
+    # can actually cache it).
+    draft_system_prompt = (
+        "You are a professional content writer. You write drafts that follow a "
+        "given outline faithfully, hit the requested approximate word count, and "
+        "match the requested tone. Below is a reference bank of tone examples; "
+        "when a tone is requested, use the example inside the matching tags as a "
+        "style reference.\n\n"
+        + few_shot_bank
+    )
+
+    # Initialize the LLM (defaults to gpt-4o-mini for a balance of cost and
+    # capability). Setting OPENAI_API_BASE / MODEL_NAME in .env points the
+    # same client at any OpenAI-compatible endpoint, e.g. a local vLLM server
+    # (see docker-compose.yml) whose continuous batching and prefix caching
+    # let concurrent users share the static few-shot prompt blocks.
+    # Every LLM call (invoke/stream and the .batch draft-variant fan-out)
+    # runs on this one sync client, so a single keep-alive pool covers the
+    # parallel paths. Don't add a cached AsyncClient here: pooled async
+    # connections stay bound to the event loop they were opened on, which a
+    # per-click asyncio.run() would close behind them.
+    llm = ChatOpenAI(
+        temperature=0.7,
+        model_name=os.getenv("MODEL_NAME", "gpt-4o-mini"),
+        openai_api_key=API_KEY,
+        base_url=os.getenv("OPENAI_API_BASE"),
+        streaming=True,  # Stream tokens so the UI can render them as they arrive
+        http_client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=20))
+    )
+
+    # Initialize the simple output parser
+    parser = StrOutputParser()
+
+    # Chain 1: Idea Generation (LCEL Pipeline: Prompt | LLM | Parser)
+    idea_template = PromptTemplate(
+        input_variables=["topic", "content_type"],
+        template="Generate 3 distinct content ideas for a {content_type} about {topic}. Present them as a bulleted list."
+    )
+    idea_chain = idea_template | llm | parser # LCEL setup
+
+    # Chain 2: Outline (LCEL Pipeline: Prompt | LLM | Parser)
+    outline_template = PromptTemplate(
+        input_variables=["idea"],
+        template="Create a detailed, multi-point outline for the following content idea. The outline should be structured to flow logically from introduction to conclusion.\n\nIdea:\n{idea}"
+    )
+    outline_chain = outline_template | llm | parser # LCEL setup
+
+    # Chain 3: Draft (LCEL Pipeline: Prompt | LLM | Parser). A chat prompt
+    # with a fully static system message: only the short human turn varies.
+    draft_template = ChatPromptTemplate.from_messages([
+        ("system", draft_system_prompt),
+        ("human",
+         "Write a draft that is approximately {length} words long, in a {tone} "
+         "tone (use the <{tone}> example above as a style reference), based on "
+         "this outline:\n{outline}")
+    ])
+    draft_chain = draft_template | llm | parser # LCEL setup
+
+    # Fused Chain 2+3: outline and draft from one call, for users who click
+    # straight through without editing the outline — one HTTP round trip
+    # (TCP+TLS+OpenAI queueing) instead of two. Output is parsed back into
+    # the separate outline/draft boxes via the OUTLINE:/DRAFT: markers.
+    outline_draft_template = ChatPromptTemplate.from_messages([
+        ("system", draft_system_prompt),
+        ("human",
+         "First create a detailed, multi-point outline for the content idea "
+         "below, structured to flow logically from introduction to conclusion. "
+         "Then write a draft that is approximately {length} words long, in a "
+         "{tone} tone (use the <{tone}> example above as a style reference), "
+         "following your outline.\n\n"
+         "Return your response exactly as:\n"
+         "OUTLINE:\n<the outline>\n\nDRAFT:\n<the draft>\n\n"
+         "Idea:\n{idea}")
+    ])
+    outline_draft_chain = outline_draft_template | llm | parser # LCEL setup
+
+    # Chain 4: SEO & Tone Refinement (LCEL Pipeline: Prompt | LLM | Parser)
+    refine_template = PromptTemplate(
+        input_variables=["draft", "tone"],
+        template=(
+            "You are an editor. Refine drafts as follows:\n"
+            "1.  Improve clarity and flow.\n"
+            "2.  Ensure the requested tone is consistent throughout (the tone "
+            "examples below show what each tone should sound like).\n"
+            "3.  Suggest 3-5 relevant SEO keywords.\n\n"
+            "Return your response in two parts, separated by '---NOTES---'.\n"
+            "Part 1: The full, refined content.\n"
+            "Part 2: Your SEO and refinement notes.\n\n"
+            + few_shot_bank
+            + "\n\nRequested tone: {tone}\n\nDraft:\n{draft}"
+        )
+    )
+    refine_chain = refine_template | llm | parser # LCEL setup
+
+    # Chain 4a/4b: the refinement work splits into two independent sub-prompts
+    # (clarity/tone rewrite and SEO keyword suggestions) so the fused workflow can
+    # run them concurrently instead of serializing them inside one call.
+    clarify_template = PromptTemplate(
+        input_variables=["draft", "tone"],
+        template=(
+            "You are an editor. Improve the clarity and flow of drafts and ensure "
+            "the requested tone is consistent throughout (the tone examples below "
+            "show what each tone should sound like). Return only the refined "
+            "content, with no commentary.\n\n"
+            + few_shot_bank
+            + "\n\nRequested tone: {tone}\n\nDraft:\n{draft}"
+        )
+    )
+    clarify_chain = clarify_template | llm | parser # LCEL setup
+
+    seo_template = PromptTemplate(
+        input_variables=["draft"],
+        template="Suggest 3-5 relevant SEO keywords for the following draft, with a one-line note on each.\n\nDraft:\n{draft}"
+    )
+    seo_chain = seo_template | llm | parser # LCEL setup
+
+    # Fused Chain: runs all four stages in one .invoke(), avoiding three extra
+    # client<->server round trips when the user doesn't need to edit between
+    # stages. Passing both sub-chains to the last .assign() makes LCEL execute
+    # them as a RunnableParallel, so the refine stage costs max(latencies)
+    # rather than sum(latencies).
+    full_chain = (
+        RunnablePassthrough.assign(idea=idea_chain)
+        | RunnablePassthrough.assign(outline=outline_chain)
+        | RunnablePassthrough.assign(draft=draft_chain)
+        | RunnablePassthrough.assign(final=clarify_chain, notes=seo_chain)
+    )
+
+    return {
+        "llm": llm,
+        "idea": idea_chain,
+        "outline": outline_chain,
+        "outline_draft": outline_draft_chain,
+        "draft": draft_chain,
+        "refine": refine_chain,
+        "clarify": clarify_chain,
+        "seo": seo_chain,
+        "full": full_chain,
+    }
+
+CHAINS = build_chains()
+
+# --- Cached LLM calls ---
+# Streamlit hashes the arguments, so re-clicking a button with unchanged
+# inputs returns the previous response instead of re-hitting the OpenAI API.
+# The wrappers render through st.write_stream: on a cache miss the tokens
+# stream into the UI as they arrive, and on a hit st.cache_data replays the
+# captured element instantly alongside returning the final string.
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_idea(topic, content_type):
+    """Generate content ideas for a topic, streaming them as they arrive."""
+    return st.write_stream(CHAINS["idea"].stream({"topic": topic, "content_type": content_type}))
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_outline(idea):
+    """Generate an outline for an idea, streaming it as it arrives."""
+    return st.write_stream(CHAINS["outline"].stream({"idea": idea}))
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_outline_draft(idea, tone, length):
+    """Generate an outline and draft in one call (or return them cached)."""
+    return CHAINS["outline_draft"].invoke({"idea": idea, "tone": tone, "length": length})
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_draft(outline, tone, length):
+    """Generate a draft for an outline, streaming it as it arrives."""
+    return st.write_stream(CHAINS["draft"].stream({"outline": outline, "tone": tone, "length": length}))
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_refine(draft, tone):
+    """Refine a draft, streaming the response as it arrives."""
+    return st.write_stream(CHAINS["refine"].stream({"draft": draft, "tone": tone}))
+
+def generate_draft_variants(tones, outline, length):
+    """Generate drafts for several tones concurrently.
+
+    .batch() fans the calls out on LCEL's thread pool over the shared sync
+    client, so wall-clock time is roughly the slowest single call rather
+    than the sum. max_concurrency caps in-flight requests to stay under
+    OpenAI rate limits.
+    """
+    return CHAINS["draft"].batch(
+        [{"tone": tone, "outline": outline, "length": length} for tone in tones],
+        config={"max_concurrency": 5}
+    )
+
+# --- 5. Helper Functions ---
+
+@st.cache_data(show_spinner=False)
+def build_export(topic, content_type, tone, length, idea, outline, draft, final_content, notes):
+    """Assemble the full workflow into one markdown document for export.
+
+    Cached on its inputs so the string is only rebuilt when some part of the
+    workflow actually changed, not on every unrelated rerun.
+    """
+    return f"""
+# Topic: {topic}
+(Type: {content_type}, Tone: {tone}, Length: {length})
+
+## 1. Ideas
+{idea}
+
+## 2. Outline
+{outline}
+
+## 3. Draft
+{draft}
+
+## 4. Final Refined Content
+{final_content}
+
+## 5. Refinement Notes
+{notes}
+"""
+
+# --- 6. Streamlit UI ---
+
+st.title("🤖 AI Content Workflow Tool")
+st.caption("Generate and refine content using AI-powered prompt chaining.")
+
+# Initialize database
+init_db()
+
+# Initialize session state variables
+if "idea" not in st.session_state:
+    st.session_state.idea = ""
+if "outline" not in st.session_state:
+    st.session_state.outline = ""
+if "draft" not in st.session_state:
+    st.session_state.draft = ""
+if "final_content" not in st.session_state:
+    st.session_state.final_content = ""
+if "notes" not in st.session_state:
+    st.session_state.notes = ""
+if "draft_variants" not in st.session_state:
+    st.session_state.draft_variants = {}
+
+# --- Sidebar Controls ---
+with st.sidebar:
+    st.header("⚙️ Workflow Controls")
+    st.markdown("Configure the content generation parameters.")
+
+    # A form batches the control widgets: changing tone/length/topic no longer
+    # reruns the whole script on every interaction, only on "Apply".
+    with st.form("controls", border=False):
+        content_type = st.selectbox(
+            "Content Type",
+            ["Blog Post", "Ad Copy", "Social Media Caption"],
+            key="content_type"
+        )
+
+        tone = st.selectbox(
+            "Tone / Personality",
+            ["Professional", "Witty", "Casual", "Informative"],
+            key="tone"
+        )
+
+        length = st.select_slider(
+            "Approximate Length",
+            options=["Short (50 words)", "Medium (150 words)", "Long (300 words)"],
+            key="length"
+        )
+
+        st.divider()
+        user_topic = st.text_input("Enter your main topic or keyword:", key="user_topic")
+        force_regen = st.checkbox(
+            "Force regenerate",
+            key="force_regen",
+            help="Bypass the response cache and re-call the API even for repeated inputs."
+        )
+        st.form_submit_button("Apply Settings", use_container_width=True)
+
+# --- Full Workflow Shortcut ---
+if st.button("🚀 Run Entire Workflow", use_container_width=True):
+    if user_topic:
+        with st.spinner("Running the full workflow (idea → outline → draft → refine)..."):
+            # One fused invocation instead of four separate button presses
+            results = CHAINS["full"].invoke({
+                "topic": user_topic,
+                "content_type": content_type,
+                "tone": tone,
+                "length": length.split(" ")[0] # e.g., "Short"
+            })
+            st.session_state.idea = results["idea"]
+            st.session_state.outline = results["outline"]
+            st.session_state.draft = results["draft"]
+            # The parallel refine stage returns content and notes separately
+            st.session_state.final_content = results["final"].strip()
+            st.session_state.notes = results["notes"].strip()
+    else:
+        st.warning("Please enter a topic in the sidebar.")
+
+# --- Main Workflow Area ---
+# Each stage is a fragment: clicking a stage button reruns only that stage's
+# function, not the whole script, so the other stages (and the LangChain
+# setup above) aren't re-executed per interaction. Handlers that only touch
+# their own stage call st.rerun(scope="fragment") to refresh the stage's text
+# area; st.rerun() defaults to scope="app" and would rerun the whole script.
+
+@st.fragment
+def idea_stage():
+    """Stage 1: generate content ideas from the sidebar topic."""
+    st.subheader("1. Idea Generation")
+    st.session_state.idea = st.text_area(
+        "Generated Ideas",
+        value=st.session_state.idea,
+        height=150,
+        key="idea_text",
+        help="Ideas will appear here. You can edit them before the next step."
+    )
+    if st.button("1. Generate Ideas", use_container_width=True, type="primary"):
+        if st.session_state.user_topic:
+            with st.spinner("Generating ideas..."):
+                if st.session_state.force_regen:
+                    cached_idea.clear()
+                st.session_state.idea = cached_idea(st.session_state.user_topic, st.session_state.content_type)
+                st.rerun(scope="fragment") # Refresh just this stage's text area
+        else:
+            st.warning("Please enter a topic in the sidebar.")
+
+@st.fragment
+def outline_stage():
+    """Stage 2: turn the (possibly edited) ideas into an outline."""
+    st.subheader("2. Outline")
+    st.session_state.outline = st.text_area(
+        "Generated Outline",
+        value=st.session_state.outline,
+        height=200,
+        key="outline_text",
+        help="The outline will appear here. You can edit it before drafting."
+    )
+    skip_editing = st.checkbox(
+        "Skip outline editing",
+        key="skip_outline",
+        help="Generate the outline and the draft in a single LLM call instead of two."
+    )
+    if st.button("2. Generate Outline", use_container_width=True, type="primary"):
+        if st.session_state.idea:
+            if skip_editing:
+                with st.spinner("Generating outline and draft in one call..."):
+                    if st.session_state.force_regen:
+                        cached_outline_draft.clear()
+                    response = cached_outline_draft(
+                        st.session_state.idea_text,
+                        st.session_state.tone,
+                        st.session_state.length.split(" ")[0] # e.g., "Short"
+                    )
+                    # Split on the DRAFT: marker; fall back to treating the
+                    # whole response as the outline if the model omitted it.
+                    outline_part, sep, draft_part = response.partition("\nDRAFT:")
+                    st.session_state.outline = outline_part.removeprefix("OUTLINE:").strip()
+                    if sep:
+                        st.session_state.draft = draft_part.strip()
+                    # Full-app rerun: the draft box lives in another fragment.
+                    st.rerun(scope="app")
+            else:
+                with st.spinner("Generating outline..."):
+                    # We use the (potentially edited) text from the box
+                    if st.session_state.force_regen:
+                        cached_outline.clear()
+                    st.session_state.outline = cached_outline(st.session_state.idea_text)
+                    st.rerun(scope="fragment")
+        else:
+            st.warning("Please generate an idea first.")
+
+@st.fragment
+def draft_stage():
+    """Stage 3: write a draft from the (possibly edited) outline."""
+    st.subheader("3. Draft Content")
+    st.session_state.draft = st.text_area(
+        "Generated Draft",
+        value=st.session_state.draft,
+        height=300,
+        key="draft_text",
+        help="The first draft will appear here. You can edit it before refinement."
+    )
+    if st.button("3. Generate Draft", use_container_width=True, type="primary"):
+        if st.session_state.outline:
+            with st.spinner("Generating draft..."):
+                if st.session_state.force_regen:
+                    cached_draft.clear()
+                st.session_state.draft = cached_draft(
+                    st.session_state.outline_text,
+                    st.session_state.tone,
+                    st.session_state.length.split(" ")[0] # e.g., "Short"
+                )
+                st.rerun(scope="fragment")
+        else:
+            st.warning("Please generate an outline first.")
+    if st.button("Draft in All Tones", use_container_width=True):
+        if st.session_state.outline:
+            with st.spinner("Generating drafts in all four tones concurrently..."):
+                tones = list(FEW_SHOT_EXAMPLES)
+                variants = generate_draft_variants(
+                    tones,
+                    st.session_state.outline_text,
+                    st.session_state.length.split(" ")[0] # e.g., "Short"
+                )
+                st.session_state.draft_variants = dict(zip(tones, variants))
+                st.rerun(scope="fragment")
+        else:
+            st.warning("Please generate an outline first.")
+    for variant_tone, variant_text in st.session_state.draft_variants.items():
+        with st.expander(f"{variant_tone} draft variant"):
+            st.markdown(variant_text)
+
+@st.fragment
+def refine_stage():
+    """Stage 4: refine the draft and extract SEO notes."""
+    st.subheader("4. SEO & Tone Refinement")
+    st.session_state.final_content = st.text_area(
+        "Refined Content",
+        value=st.session_state.final_content,
+        height=300,
+        key="final_content_text",
+        help="The final, polished content will appear here."
+    )
+    if st.button("4. Refine Content", use_container_width=True, type="primary"):
+        if st.session_state.draft:
+            with st.spinner("Refining content..."):
+                if st.session_state.force_regen:
+                    cached_refine.clear()
+                response = cached_refine(st.session_state.draft_text, st.session_state.tone)
+                # Split on the separator; partition scans the string once and
+                # degrades gracefully when the model omits the separator.
+                content, sep, notes = response.partition("---NOTES---")
+                st.session_state.final_content = content.strip()
+                st.session_state.notes = notes.strip() if sep else "No notes provided."
+                # Full-app rerun: the notes expander and the save/export
+                # section below depend on this stage's output.
+                st.rerun(scope="app")
+        else:
+            st.warning("Please generate a draft first.")
+
+# Tabs show one stage at a time instead of stacking four large text areas
+# vertically. Note st.tabs still renders every tab's content on each run and
+# ships it all to the browser — only visibility changes — so this is a layout
+# cleanup, not a rendering optimization.
+tab1, tab2, tab3, tab4 = st.tabs(["1. Ideas", "2. Outline", "3. Draft", "4. Refined"])
+with tab1:
+    idea_stage()
+with tab2:
+    outline_stage()
+with tab3:
+    draft_stage()
+with tab4:
+    refine_stage()
+
+# Display Refinement Notes
+if st.session_state.notes:
+    with st.expander("View SEO & Refinement Notes"):
+        st.markdown(st.session_state.notes)
+
+st.divider()
+
+# --- 5. Evaluation, Saving, and Exporting ---
+st.subheader("5. Evaluate, Save & Export")
+
+if st.session_state.final_content:
+    col1, col2, col3 = st.columns([1, 1, 2])
+    
+    with col1:
+        clarity_score = st.slider("Clarity Score", 1, 5, 3)
+    with col2:
+        engagement_score = st.slider("Engagement Score", 1, 5, 3)
+    
+    with col3:
+        st.markdown("---") # For vertical alignment
+        if st.button("Save to History", use_container_width=True):
+            save_content(
+                st.session_state.content_type,
+                st.session_state.tone,
+                st.session_state.length,
+                st.session_state.user_topic,
+                st.session_state.idea_text,
+                st.session_state.outline_text,
+                st.session_state.draft_text,
+                st.session_state.final_content_text,
+                clarity_score,
+                engagement_score
+            )
+    
+    st.markdown("---")
+    
+    # Prepare export content (cached; only rebuilt when the workflow changed)
+    export_md_content = build_export(
+        st.session_state.user_topic,
+        st.session_state.content_type,
+        st.session_state.tone,
+        st.session_state.length,
+        st.session_state.idea_text,
+        st.session_state.outline_text,
+        st.session_state.draft_text,
+        st.session_state.final_content_text,
+        st.session_state.notes
+    )
+
+    # Export Buttons
+    export_col1, export_col2 = st.columns(2)
+    with export_col1:
+        st.download_button(
+            "Export as Markdown (.md)",
+            data=export_md_content,
+            file_name="ai_content.md",
+            mime="text/markdown",
+            use_container_width=True
+        )
+    with export_col2:
+        st.download_button(
+            "Export as Text (.txt)",
+            data=export_md_content,
+            file_name="ai_content.txt",
+            mime="text/plain",
+            use_container_width=True
+        )
+else:
+    st.info("Generate content to enable saving and exporting.")